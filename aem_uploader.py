@@ -1,13 +1,64 @@
 import os
 import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from get_token import get_aem_token
 import urllib.parse
+import mmap
+import random
 import time
 
+def split_into_parts(file_size: int, file_info: Dict[str, Any]) -> List[Tuple[str, int, int]]:
+    """Split a file into (uri, start, end) parts sized within AEM's part limits.
+
+    AEM's initiate-upload response hands out one signed URI per part along
+    with minPartSize/maxPartSize; each URI is meant to receive its own byte
+    range so the parts can be transferred in parallel.
+    """
+    upload_uris = file_info['uploadURIs']
+    part_size = -(-file_size // len(upload_uris))  # ceiling division
+    min_part_size = int(file_info.get('minPartSize', 0))
+    max_part_size = int(file_info.get('maxPartSize', 0))
+    if min_part_size:
+        part_size = max(part_size, min_part_size)
+    if max_part_size:
+        part_size = min(part_size, max_part_size)
+
+    parts = []
+    for i, uri in enumerate(upload_uris):
+        start = i * part_size
+        if start >= file_size:
+            break
+        parts.append((uri, start, min(start + part_size, file_size)))
+    return parts
+
+class TokenBucket:
+    """Thread-safe token bucket capping the total request rate across workers."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
 class AEMUploader:
     def __init__(self):
         self.aem_enabled = os.getenv('AEM_ENABLED', 'false').lower() == 'true'
@@ -16,7 +67,29 @@ class AEMUploader:
             self.aem_token = get_aem_token()  # Get token from get_token.py
             self.aem_destination = os.getenv('AEM_DESTINATION', '/content/dam/images')
             self.put_into_date_folder = os.getenv('AEM_PUT_INTO_DATE_FOLDER', 'false').lower() == 'true'
-            
+
+            # Use a single session so all calls to the AEM host reuse pooled
+            # keep-alive connections instead of paying a new TCP+TLS handshake
+            # per request. The pool is sized for NUM_THREADS concurrent workers.
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+            self.session.mount(self.aem_host, adapter)
+            self.session.headers.update({'Authorization': f'Bearer {self.aem_token}'})
+            # No proxies are involved, so skip the per-call environment lookup
+            self.session.trust_env = False
+            # Fail fast instead of letting a hung instance block a worker forever
+            self._timeout = (3.05, float(os.getenv('AEM_HTTP_TIMEOUT', '30')))
+
+            # Remember folders we have already seen or created so repeated
+            # uploads into the same path skip the existence round trips.
+            self._folder_cache = set()
+            self._folder_cache_lock = threading.Lock()
+            self._destination_cache = {}
+
+            # Cap the request rate client-side so high thread counts don't
+            # trip AEM's own limits and turn the retry loops into a storm
+            self._bucket = TokenBucket(rate=float(os.getenv('AEM_MAX_RPS', '20')), capacity=40)
+
             # Configure logging
             logging.basicConfig(
                 level=logging.INFO,
@@ -25,57 +98,132 @@ class AEMUploader:
             self.logger = logging.getLogger('AEMUploader')
             self.logger.setLevel(logging.ERROR)
 
+    def close(self) -> None:
+        """Close the underlying HTTP session and its pooled connections."""
+        if self.aem_enabled and self.session is not None:
+            self.session.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _refresh_token(self) -> None:
+        """Re-read the token file and update the session's auth header."""
+        self.aem_token = get_aem_token(force=True)
+        self.session.headers.update({'Authorization': f'Bearer {self.aem_token}'})
+
+    def _request(self, method: str, url: str, **kwargs):
+        """Issue a request on the shared session.
+
+        Waits for the rate limiter before sending. A 401 means the bearer
+        token expired mid-run; refresh it from the token file and retry the
+        request once.
+        """
+        kwargs.setdefault('timeout', self._timeout)
+        self._bucket.acquire()
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code == 401:
+            self.logger.warning("Got 401, refreshing AEM token and retrying once")
+            self._refresh_token()
+            self._bucket.acquire()
+            response = self.session.request(method, url, **kwargs)
+        return response
+
+    def _sleep_backoff(self, attempt: int, response=None) -> None:
+        """Sleep before the next retry attempt.
+
+        Honors a Retry-After header when the server sent one; otherwise uses
+        full-jitter exponential backoff so concurrent workers don't retry in
+        lock-step and stampede the server.
+        """
+        if response is not None and 'Retry-After' in response.headers:
+            try:
+                time.sleep(min(30, float(response.headers['Retry-After'])))
+                return
+            except ValueError:
+                pass
+        time.sleep(random.uniform(0, min(30, 0.5 * 2 ** attempt)))
+
+    @staticmethod
+    def _is_retryable(status_code: int) -> bool:
+        """Whether an HTTP status is worth retrying (throttling or server error)."""
+        return status_code == 429 or status_code >= 500
+
     def _get_destination_path(self, date: datetime) -> str:
         """Get the destination path based on date if AEM_PUT_INTO_DATE_FOLDER is true."""
         if self.put_into_date_folder:
-            year = date.strftime('%Y')
-            month = date.strftime('%m')
-            return f"{self.aem_destination}/{year}/{month}"
+            # Key on the destination too since it can be overridden per upload
+            key = (self.aem_destination, date.year, date.month)
+            path = self._destination_cache.get(key)
+            if path is None:
+                path = f"{self.aem_destination}/{date.strftime('%Y')}/{date.strftime('%m')}"
+                self._destination_cache[key] = path
+            return path
         return self.aem_destination
 
     def _create_folder(self, folder_path: str, max_retries: int = 3, retry_delay: int = 2) -> bool:
-        """Create a folder in AEM if it doesn't exist, with retry mechanism."""
+        """Create a folder in AEM if it doesn't exist, with retry mechanism.
+
+        The sling folder POST is effectively idempotent (200 for an existing
+        folder, 201 for a new one), so the folder is created directly and a
+        check-GET only happens when the POST answer is ambiguous — half the
+        round trips of check-then-create.
+        """
+        with self._folder_cache_lock:
+            if folder_path in self._folder_cache:
+                return True
+
         for attempt in range(max_retries):
             try:
                 headers = {
-                    'Authorization': f'Bearer {self.aem_token}',
                     'Content-Type': 'application/x-www-form-urlencoded'
                 }
-                
-                # Check if folder exists
-                check_url = f'{self.aem_host}{folder_path}.json'
-                response = requests.get(check_url, headers=headers)
-                
-                if response.status_code == 200:
-                    self.logger.info(f"Folder {folder_path} exists")
-                    return True
-                
+
                 # Create folder
                 create_url = f'{self.aem_host}{folder_path}'
                 data = {
                     'class': 'sling:Folder',
                     'jcr:primaryType': 'sling:Folder'
                 }
-                
+
                 self.logger.info(f"Creating folder {folder_path} (attempt {attempt + 1}/{max_retries})")
-                response = requests.post(create_url, headers=headers, data=data)
-                
-                if response.status_code in [200, 201]:
-                    # Wait a bit to ensure folder is properly created
-                    time.sleep(retry_delay)
-                    self.logger.info(f"Successfully created folder {folder_path}")
+                response = self._request('POST', create_url, headers=headers, data=data)
+
+                if response.status_code in [200, 201, 302]:
+                    if response.status_code == 201:
+                        # Wait a bit to ensure the new folder is properly created
+                        time.sleep(retry_delay)
+                    self.logger.info(f"Folder {folder_path} is available")
+                    with self._folder_cache_lock:
+                        self._folder_cache.add(folder_path)
                     return True
+                elif 400 <= response.status_code < 500:
+                    # Ambiguous client error - check whether the folder exists
+                    check_url = f'{self.aem_host}{folder_path}.json'
+                    check = self._request('GET', check_url, headers=headers)
+                    if check.status_code == 200:
+                        self.logger.info(f"Folder {folder_path} exists")
+                        with self._folder_cache_lock:
+                            self._folder_cache.add(folder_path)
+                        return True
+                    self.logger.warning(f"Failed to create folder {folder_path} (attempt {attempt + 1}/{max_retries}): {response.text}")
+                    if attempt < max_retries - 1:
+                        self._sleep_backoff(attempt, response)
+                        continue
+                    return False
                 else:
                     self.logger.warning(f"Failed to create folder {folder_path} (attempt {attempt + 1}/{max_retries}): {response.text}")
                     if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
+                        self._sleep_backoff(attempt, response)
                         continue
                     return False
-                    
+
             except Exception as e:
                 self.logger.error(f"Error creating folder {folder_path}: {str(e)}")
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    self._sleep_backoff(attempt)
                     continue
                 return False
 
@@ -83,7 +231,12 @@ class AEMUploader:
         """Ensure all folders in the path exist, creating them if necessary."""
         if not self.put_into_date_folder:
             return True
-            
+
+        # Once the deepest folder is known the whole path must exist
+        with self._folder_cache_lock:
+            if destination_path in self._folder_cache:
+                return True
+
         # Split the path into components
         path_parts = destination_path.split('/')
         current_path = ''
@@ -117,7 +270,7 @@ class AEMUploader:
         self.logger.info("Curl command for testing:")
         self.logger.info(' '.join(curl_cmd))
 
-    def upload(self, image_path: Path, date: datetime, tags: List[str]) -> bool:
+    def upload(self, image_path: Path, date: datetime, tags: List[str], file_size: int = None) -> bool:
         """Upload an image to AEM using the Assets API."""
         if not self.aem_enabled:
             self.logger.info("AEM upload is disabled")
@@ -134,7 +287,7 @@ class AEMUploader:
             
             # Step 1: Initiate upload
             self.logger.info(f"Step 1: Initiating upload for {image_path.name} to {destination_path}")
-            upload_info = self._initiate_upload(image_path, destination_path)
+            upload_info = self._initiate_upload(image_path, destination_path, file_size=file_size)
             if not upload_info:
                 return False
 
@@ -151,24 +304,30 @@ class AEMUploader:
             self.logger.error(f"Failed to upload {image_path} to AEM: {str(e)}")
             return False
 
-    def _initiate_upload(self, image_path: Path, destination_path: str, max_retries: int = 3, retry_delay: int = 2) -> Dict[str, Any]:
-        """Step 1: Initiate the upload process with retry mechanism."""
+    def _initiate_upload(self, image_path: Path, destination_path: str, max_retries: int = 3, retry_delay: int = 2, file_size: int = None) -> Dict[str, Any]:
+        """Step 1: Initiate the upload process with retry mechanism.
+
+        Callers that already know the file size pass it in so no stat
+        syscall is needed here (or on any retry).
+        """
+        if file_size is None:
+            file_size = image_path.stat().st_size
+
         for attempt in range(max_retries):
             try:
                 headers = {
-                    'Authorization': f'Bearer {self.aem_token}',
                     'Content-Type': 'application/x-www-form-urlencoded'
                 }
-                
+
                 data = {
                     'fileName': image_path.name,
-                    'fileSize': image_path.stat().st_size
+                    'fileSize': file_size
                 }
-                
+
                 url = f'{self.aem_host}{destination_path}.initiateUpload.json'
                 self.logger.info(f"Initiating upload to {url} (attempt {attempt + 1}/{max_retries})")
                 
-                response = requests.post(url, headers=headers, data=data)
+                response = self._request('POST', url, headers=headers, data=data)
                 
                 if response.status_code == 200:
                     self.logger.info("Upload initiation successful")
@@ -176,72 +335,147 @@ class AEMUploader:
                 else:
                     self.logger.warning(f"Failed to initiate upload (attempt {attempt + 1}/{max_retries}): {response.text}")
                     if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
+                        self._sleep_backoff(attempt, response)
                         continue
                     return None
-                    
+
             except Exception as e:
                 self.logger.error(f"Error during upload initiation: {str(e)}")
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    self._sleep_backoff(attempt)
+                    continue
+                return None
+
+    def _initiate_upload_batch(self, image_paths: List[Path], destination_path: str, max_retries: int = 3) -> List[Dict[str, Any]]:
+        """Initiate uploads for several files bound for one folder in a single POST.
+
+        AEM's initiateUpload accepts repeated fileName/fileSize fields and
+        returns one files entry per input in the same order, so a batch of N
+        assets costs one round trip instead of N. Each returned dict has the
+        same shape as a _initiate_upload result for that single file.
+        """
+        # Stat each file once, outside the retry loop
+        data = []
+        for image_path in image_paths:
+            data.append(('fileName', image_path.name))
+            data.append(('fileSize', image_path.stat().st_size))
+
+        for attempt in range(max_retries):
+            try:
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded'
+                }
+
+                url = f'{self.aem_host}{destination_path}.initiateUpload.json'
+                self.logger.info(f"Initiating batch upload of {len(image_paths)} files to {url} (attempt {attempt + 1}/{max_retries})")
+
+                response = self._request('POST', url, headers=headers, data=data)
+
+                if response.status_code == 200:
+                    self.logger.info("Batch upload initiation successful")
+                    payload = response.json()
+                    return [{'files': [file_info], 'completeURI': payload['completeURI']}
+                            for file_info in payload['files']]
+                else:
+                    self.logger.warning(f"Failed to initiate batch upload (attempt {attempt + 1}/{max_retries}): {response.text}")
+                    if attempt < max_retries - 1:
+                        self._sleep_backoff(attempt, response)
+                        continue
+                    return None
+
+            except Exception as e:
+                self.logger.error(f"Error during batch upload initiation: {str(e)}")
+                if attempt < max_retries - 1:
+                    self._sleep_backoff(attempt)
                     continue
                 return None
 
     def _upload_binary(self, image_path: Path, upload_info: Dict[str, Any]) -> bool:
-        """Step 2: Upload the binary to the signed URL."""
+        """Step 2: Upload the binary to the signed URLs, one part per URI in parallel."""
         try:
-            upload_uris = upload_info['files'][0]['uploadURIs']
-            self.logger.info(f"Uploading to {len(upload_uris)} URIs")
-            
+            file_info = upload_info['files'][0]
+            self.logger.info(f"Uploading to {len(file_info['uploadURIs'])} URIs")
+
+            # Map the file instead of reading it into a bytes object; the
+            # kernel pages bytes in on demand and the slices below are
+            # zero-copy views rather than per-part copies.
             with open(image_path, 'rb') as f:
-                file_data = f.read()
-                
-            for uri in upload_uris:
-                self.logger.info(f"Uploading to URI: {uri}")
-                response = requests.put(uri, data=file_data)
-                if response.status_code not in [200, 201, 204]:
-                    self.logger.error(f"Failed to upload binary: {response.text}")
+                file_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                view = memoryview(file_data)
+                parts = split_into_parts(len(file_data), file_info)
+
+                def _put_part(part: Tuple[str, int, int], max_retries: int = 3) -> bool:
+                    uri, start, end = part
+                    for attempt in range(max_retries):
+                        self.logger.info(f"Uploading bytes {start}-{end} to URI: {uri}")
+                        response = self._request('PUT', uri, data=view[start:end])
+                        if response.status_code in [200, 201, 204]:
+                            return True
+                        if self._is_retryable(response.status_code) and attempt < max_retries - 1:
+                            self.logger.warning(f"Retrying binary part (attempt {attempt + 1}/{max_retries}): {response.status_code}")
+                            self._sleep_backoff(attempt, response)
+                            continue
+                        self.logger.error(f"Failed to upload binary: {response.text}")
+                        return False
                     return False
-                    
+
+                with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+                    for ok in executor.map(_put_part, parts):
+                        if not ok:
+                            return False
+            finally:
+                view.release()
+                file_data.close()
+
             self.logger.info("Binary upload completed successfully")
             return True
-            
+
         except Exception as e:
             self.logger.error(f"Error during binary upload: {str(e)}")
             return False
 
-    def _complete_upload(self, image_path: Path, upload_info: Dict[str, Any], 
-                        date: datetime, tags: List[str]) -> bool:
-        """Step 3: Complete the upload process."""
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.aem_token}',
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
-            
-            data = {
-                'uploadToken': upload_info['files'][0]['uploadToken'],
-                'fileName': image_path.name,
-                'mimeType': 'image/jpeg',
-                'jcr:title': image_path.stem,
-                'jcr:description': f'Uploaded on {date.strftime("%Y-%m-%d")}',
-                'jcr:tags': ",".join(tags)
-            }
-            
-            self.logger.info("Completing upload process")
-            response = requests.post(
-                f'{self.aem_host}{upload_info["completeURI"]}',
-                headers=headers,
-                data=data
-            )
-            
-            if response.status_code in [200, 201]:
-                self.logger.info("Upload completed successfully")
-                return True
-            else:
-                self.logger.error(f"Failed to complete upload: {response.text}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error during upload completion: {str(e)}")
-            return False 
\ No newline at end of file
+    def _complete_upload(self, image_path: Path, upload_info: Dict[str, Any],
+                        date: datetime, tags: List[str], max_retries: int = 3) -> bool:
+        """Step 3: Complete the upload process, retrying throttled or failed attempts."""
+        for attempt in range(max_retries):
+            try:
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded'
+                }
+
+                data = {
+                    'uploadToken': upload_info['files'][0]['uploadToken'],
+                    'fileName': image_path.name,
+                    'mimeType': 'image/jpeg',
+                    'jcr:title': image_path.stem,
+                    'jcr:description': f'Uploaded on {date.strftime("%Y-%m-%d")}',
+                    'jcr:tags': ",".join(tags)
+                }
+
+                self.logger.info("Completing upload process")
+                response = self._request(
+                    'POST',
+                    f'{self.aem_host}{upload_info["completeURI"]}',
+                    headers=headers,
+                    data=data
+                )
+
+                if response.status_code in [200, 201]:
+                    self.logger.info("Upload completed successfully")
+                    return True
+                elif self._is_retryable(response.status_code) and attempt < max_retries - 1:
+                    self.logger.warning(f"Retrying upload completion (attempt {attempt + 1}/{max_retries}): {response.status_code}")
+                    self._sleep_backoff(attempt, response)
+                    continue
+                else:
+                    self.logger.error(f"Failed to complete upload: {response.text}")
+                    return False
+
+            except Exception as e:
+                self.logger.error(f"Error during upload completion: {str(e)}")
+                if attempt < max_retries - 1:
+                    self._sleep_backoff(attempt)
+                    continue
+                return False 
\ No newline at end of file
@@ -0,0 +1,349 @@
+import os
+import asyncio
+import random
+import aiohttp
+import aiofiles
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Any, Tuple
+from get_token import get_aem_token
+from aem_uploader import split_into_parts
+
+class AsyncAEMUploader:
+    """Asyncio variant of AEMUploader using aiohttp for the upload pipeline.
+
+    One event loop drives hundreds of in-flight uploads over a shared
+    connection pool, so throughput scales with the pool size rather than
+    the thread count of the blocking pipeline.
+    """
+
+    def __init__(self):
+        self.aem_enabled = os.getenv('AEM_ENABLED', 'false').lower() == 'true'
+        if self.aem_enabled:
+            self.aem_host = os.getenv('AEM_HOST', 'http://localhost:4502')
+            self.aem_token = get_aem_token()  # Get token from get_token.py
+            self.aem_destination = os.getenv('AEM_DESTINATION', '/content/dam/images')
+            self.put_into_date_folder = os.getenv('AEM_PUT_INTO_DATE_FOLDER', 'false').lower() == 'true'
+
+            # Configure logging
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(levelname)s - %(message)s'
+            )
+            self.logger = logging.getLogger('AsyncAEMUploader')
+            self.logger.setLevel(logging.ERROR)
+
+            # Session is created lazily inside the running event loop
+            self._session = None
+
+            # Same folder cache as the blocking uploader, guarded by an
+            # asyncio lock since all access happens on the event loop
+            self._folder_cache = set()
+            self._folder_cache_lock = asyncio.Lock()
+            self._destination_cache = {}
+
+            # Pending initiate-upload requests per destination folder; they
+            # are coalesced into one batched POST per flush window
+            self._initiate_batches = {}
+            self._batch_flush_delay = 0.05
+            self._batch_max_files = 50
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Create the shared aiohttp session on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=64, limit_per_host=64, keepalive_timeout=60)
+            timeout = aiohttp.ClientTimeout(sock_connect=3.05,
+                                            sock_read=float(os.getenv('AEM_HTTP_TIMEOUT', '30')))
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                headers={'Authorization': f'Bearer {self.aem_token}'}
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the shared session and its pooled connections."""
+        if self.aem_enabled and self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _sleep_backoff(self, attempt: int, response=None) -> None:
+        """Sleep before the next retry: Retry-After if given, else full-jitter backoff."""
+        if response is not None and 'Retry-After' in response.headers:
+            try:
+                await asyncio.sleep(min(30, float(response.headers['Retry-After'])))
+                return
+            except ValueError:
+                pass
+        await asyncio.sleep(random.uniform(0, min(30, 0.5 * 2 ** attempt)))
+
+    def _get_destination_path(self, date: datetime) -> str:
+        """Get the destination path based on date if AEM_PUT_INTO_DATE_FOLDER is true."""
+        if self.put_into_date_folder:
+            key = (self.aem_destination, date.year, date.month)
+            path = self._destination_cache.get(key)
+            if path is None:
+                path = f"{self.aem_destination}/{date.strftime('%Y')}/{date.strftime('%m')}"
+                self._destination_cache[key] = path
+            return path
+        return self.aem_destination
+
+    async def _create_folder(self, folder_path: str, max_retries: int = 3, retry_delay: int = 2) -> bool:
+        """Create a folder in AEM if it doesn't exist, with retry mechanism.
+
+        POSTs directly (the sling folder POST is effectively idempotent) and
+        only falls back to a check-GET on an ambiguous client error.
+        """
+        async with self._folder_cache_lock:
+            if folder_path in self._folder_cache:
+                return True
+
+        session = await self._get_session()
+        for attempt in range(max_retries):
+            try:
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded'
+                }
+
+                # Create folder
+                create_url = f'{self.aem_host}{folder_path}'
+                data = {
+                    'class': 'sling:Folder',
+                    'jcr:primaryType': 'sling:Folder'
+                }
+
+                self.logger.info(f"Creating folder {folder_path} (attempt {attempt + 1}/{max_retries})")
+                async with session.post(create_url, headers=headers, data=data) as response:
+                    if response.status in [200, 201, 302]:
+                        if response.status == 201:
+                            # Wait a bit to ensure the new folder is properly created
+                            await asyncio.sleep(retry_delay)
+                        self.logger.info(f"Folder {folder_path} is available")
+                        async with self._folder_cache_lock:
+                            self._folder_cache.add(folder_path)
+                        return True
+                    # Headers stay readable after the context exits
+                    failed_response = response
+                    body = await response.text()
+
+                if 400 <= failed_response.status < 500:
+                    # Ambiguous client error - check whether the folder exists
+                    check_url = f'{self.aem_host}{folder_path}.json'
+                    async with session.get(check_url, headers=headers) as check:
+                        if check.status == 200:
+                            self.logger.info(f"Folder {folder_path} exists")
+                            async with self._folder_cache_lock:
+                                self._folder_cache.add(folder_path)
+                            return True
+
+                self.logger.warning(f"Failed to create folder {folder_path} (attempt {attempt + 1}/{max_retries}): {body}")
+                if attempt < max_retries - 1:
+                    await self._sleep_backoff(attempt, failed_response)
+                    continue
+                return False
+
+            except Exception as e:
+                self.logger.error(f"Error creating folder {folder_path}: {str(e)}")
+                if attempt < max_retries - 1:
+                    await self._sleep_backoff(attempt)
+                    continue
+                return False
+
+    async def _ensure_folders_exist(self, destination_path: str) -> bool:
+        """Ensure all folders in the path exist, creating them if necessary."""
+        if not self.put_into_date_folder:
+            return True
+
+        async with self._folder_cache_lock:
+            if destination_path in self._folder_cache:
+                return True
+
+        # Split the path into components
+        path_parts = destination_path.split('/')
+        current_path = ''
+
+        # Start from the root and create each folder in the path
+        for part in path_parts:
+            if not part:
+                continue
+            current_path += f'/{part}'
+            if not await self._create_folder(current_path):
+                return False
+
+        return True
+
+    async def upload(self, image_path: Path, date: datetime, tags: List[str], file_size: int = None) -> bool:
+        """Upload an image to AEM using the Assets API."""
+        if not self.aem_enabled:
+            return True
+
+        try:
+            # Get the appropriate destination path based on date
+            destination_path = self._get_destination_path(date)
+
+            # Ensure all folders in the path exist
+            if not await self._ensure_folders_exist(destination_path):
+                self.logger.error(f"Failed to create required folders for {destination_path}")
+                return False
+
+            # Step 1: Initiate upload, coalesced with concurrent uploads
+            # bound for the same folder
+            self.logger.info(f"Step 1: Initiating upload for {image_path.name} to {destination_path}")
+            upload_info = await self._initiate_upload_batched(image_path, destination_path, file_size=file_size)
+            if not upload_info:
+                return False
+
+            # Step 2: Upload binary to signed URL
+            self.logger.info(f"Step 2: Uploading binary for {image_path.name}")
+            if not await self._upload_binary(image_path, upload_info):
+                return False
+
+            # Step 3: Complete upload
+            self.logger.info(f"Step 3: Completing upload for {image_path.name}")
+            return await self._complete_upload(image_path, upload_info, date, tags)
+
+        except Exception as e:
+            self.logger.error(f"Failed to upload {image_path} to AEM: {str(e)}")
+            return False
+
+    async def _initiate_upload_batched(self, image_path: Path, destination_path: str, file_size: int = None) -> Dict[str, Any]:
+        """Queue an initiate-upload request and await its batched result.
+
+        Requests for the same destination folder arriving within the flush
+        window (or until the batch is full) are sent as one POST with
+        repeated fileName/fileSize fields, so N concurrent uploads into a
+        folder pay a single initiation round trip.
+        """
+        if file_size is None:
+            file_size = image_path.stat().st_size
+        future = asyncio.get_running_loop().create_future()
+        batch = self._initiate_batches.setdefault(destination_path, [])
+        batch.append((image_path, file_size, future))
+
+        if len(batch) >= self._batch_max_files:
+            await self._flush_initiate_batch(destination_path)
+        elif len(batch) == 1:
+            asyncio.create_task(self._flush_initiate_batch_later(destination_path))
+
+        return await future
+
+    async def _flush_initiate_batch_later(self, destination_path: str) -> None:
+        await asyncio.sleep(self._batch_flush_delay)
+        await self._flush_initiate_batch(destination_path)
+
+    async def _flush_initiate_batch(self, destination_path: str) -> None:
+        batch = self._initiate_batches.pop(destination_path, None)
+        if not batch:
+            return
+
+        results = await self._initiate_upload_batch([(p, size) for p, size, _ in batch], destination_path)
+        for i, (_, _, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(results[i] if results else None)
+
+    async def _initiate_upload_batch(self, files: List[Tuple[Path, int]], destination_path: str, max_retries: int = 3) -> List[Dict[str, Any]]:
+        """Initiate uploads for several (path, size) files bound for one folder in a single POST."""
+        session = await self._get_session()
+
+        data = []
+        for image_path, file_size in files:
+            data.append(('fileName', image_path.name))
+            data.append(('fileSize', str(file_size)))
+
+        for attempt in range(max_retries):
+            try:
+                headers = {
+                    'Content-Type': 'application/x-www-form-urlencoded'
+                }
+
+                url = f'{self.aem_host}{destination_path}.initiateUpload.json'
+                self.logger.info(f"Initiating batch upload of {len(files)} files to {url} (attempt {attempt + 1}/{max_retries})")
+
+                async with session.post(url, headers=headers, data=data) as response:
+                    if response.status == 200:
+                        self.logger.info("Batch upload initiation successful")
+                        payload = await response.json()
+                        return [{'files': [file_info], 'completeURI': payload['completeURI']}
+                                for file_info in payload['files']]
+                    else:
+                        body = await response.text()
+                        self.logger.warning(f"Failed to initiate batch upload (attempt {attempt + 1}/{max_retries}): {body}")
+                        if attempt < max_retries - 1:
+                            await self._sleep_backoff(attempt, response)
+                            continue
+                        return None
+
+            except Exception as e:
+                self.logger.error(f"Error during batch upload initiation: {str(e)}")
+                if attempt < max_retries - 1:
+                    await self._sleep_backoff(attempt)
+                    continue
+                return None
+
+    async def _upload_binary(self, image_path: Path, upload_info: Dict[str, Any]) -> bool:
+        """Step 2: Upload the binary to the signed URL."""
+        try:
+            file_info = upload_info['files'][0]
+            self.logger.info(f"Uploading to {len(file_info['uploadURIs'])} URIs")
+
+            async with aiofiles.open(image_path, 'rb') as f:
+                file_data = await f.read()
+
+            parts = split_into_parts(len(file_data), file_info)
+            session = await self._get_session()
+
+            async def _put(uri: str, start: int, end: int) -> bool:
+                self.logger.info(f"Uploading bytes {start}-{end} to URI: {uri}")
+                async with session.put(uri, data=file_data[start:end]) as response:
+                    if response.status not in [200, 201, 204]:
+                        body = await response.text()
+                        self.logger.error(f"Failed to upload binary: {body}")
+                        return False
+                    return True
+
+            results = await asyncio.gather(*[_put(uri, start, end) for uri, start, end in parts])
+            if not all(results):
+                return False
+
+            self.logger.info("Binary upload completed successfully")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error during binary upload: {str(e)}")
+            return False
+
+    async def _complete_upload(self, image_path: Path, upload_info: Dict[str, Any],
+                               date: datetime, tags: List[str]) -> bool:
+        """Step 3: Complete the upload process."""
+        try:
+            headers = {
+                'Content-Type': 'application/x-www-form-urlencoded'
+            }
+
+            data = {
+                'uploadToken': upload_info['files'][0]['uploadToken'],
+                'fileName': image_path.name,
+                'mimeType': 'image/jpeg',
+                'jcr:title': image_path.stem,
+                'jcr:description': f'Uploaded on {date.strftime("%Y-%m-%d")}',
+                'jcr:tags': ",".join(tags)
+            }
+
+            self.logger.info("Completing upload process")
+            session = await self._get_session()
+            async with session.post(
+                f'{self.aem_host}{upload_info["completeURI"]}',
+                headers=headers,
+                data=data
+            ) as response:
+                if response.status in [200, 201]:
+                    self.logger.info("Upload completed successfully")
+                    return True
+                else:
+                    body = await response.text()
+                    self.logger.error(f"Failed to complete upload: {body}")
+                    return False
+
+        except Exception as e:
+            self.logger.error(f"Error during upload completion: {str(e)}")
+            return False
@@ -1,12 +1,10 @@
 import os
 import csv
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import logging
 from aem_uploader import AEMUploader
 import random
-import queue
-import threading
 
 class CustomerStructureReplicator:
     def __init__(self, aem_uploader: AEMUploader):
@@ -15,10 +13,7 @@ class CustomerStructureReplicator:
         self.structure_file = Path(os.getenv('REPLICATE_CUSTOMER_STRUCTURE_FILE', 'data/customer_structure.csv'))
         self.logger = logging.getLogger('CustomerStructureReplicator')
         self.logger.setLevel(logging.INFO)
-        self.task_queue = queue.Queue()
         self.processed_count = 0
-        self.processed_lock = threading.Lock()
-        self.threads = []
         self.created_folders = set()  # Track created folders
 
     def read_structure_file(self) -> List[Dict[str, str]]:
@@ -70,19 +65,14 @@ class CustomerStructureReplicator:
             self.logger.error(f"Error creating folder structure: {str(e)}")
             return False
 
-    def worker(self, image_processor) -> None:
-        """Worker function for thread processing."""
-        while True:
-            try:
-                task = self.task_queue.get_nowait()
-                folder_path, asset_count, source_image = task
-                image_processor.process_image(source_image, target_folder=folder_path)
-                
-                with self.processed_lock:
-                    self.processed_count += 1
-                    self.logger.info(f"Processed {self.processed_count} assets")
-            except queue.Empty:
-                break
+    def worker(self, image_processor, tasks: List[Tuple[str, int, Path]]) -> int:
+        """Process a pre-partitioned list of tasks and return how many were handled."""
+        count = 0
+        for folder_path, asset_count, source_image in tasks:
+            image_processor.process_image(source_image, target_folder=folder_path)
+            count += 1
+            self.logger.info(f"Processed {count}/{len(tasks)} assets in this worker")
+        return count
 
     def replicate_structure(self, image_processor) -> None:
         """Replicate the customer structure and generate assets."""
@@ -120,14 +110,14 @@ class CustomerStructureReplicator:
                     self.logger.error(f"Failed to create folder structure for {folder_path}")
                     continue
 
-            # Get all source images once
-            source_images = list(image_processor.img_dir.glob("*.jpg")) + list(image_processor.img_dir.glob("*.jpeg"))
+            # Reuse the image processor's cached directory scan
+            source_images = image_processor._list_source_images()
             if not source_images:
                 self.logger.error("No source images found for processing")
                 return
 
-            # Queue all tasks
-            total_assets = 0
+            # Collect all tasks up front
+            tasks = []
             for entry in structure:
                 folder_path = entry['folder'].strip()
                 try:
@@ -140,21 +130,17 @@ class CustomerStructureReplicator:
 
                 for _ in range(asset_count):
                     source_image = random.choice(source_images)
-                    self.task_queue.put((folder_path, asset_count, source_image))
-                    total_assets += 1
+                    tasks.append((folder_path, asset_count, source_image))
 
-            # Create and start threads
-            num_threads = min(int(os.getenv('NUM_THREADS', '4')), total_assets)
-            self.logger.info(f"Starting {num_threads} threads to process {total_assets} assets")
-            
-            for _ in range(num_threads):
-                thread = threading.Thread(target=self.worker, args=(image_processor,))
-                thread.start()
-                self.threads.append(thread)
-
-            # Wait for all threads to complete
-            for thread in self.threads:
-                thread.join()
+            # All tasks are known up front, so pre-partition them into one
+            # chunk per worker instead of paying a queue lock per task, and
+            # run them on the image processor's shared executor
+            num_threads = min(image_processor.num_threads, len(tasks))
+            self.logger.info(f"Starting {num_threads} workers to process {len(tasks)} assets")
+
+            chunks = [tasks[i::num_threads] for i in range(num_threads)]
+            counts = image_processor.executor.map(lambda chunk: self.worker(image_processor, chunk), chunks)
+            self.processed_count = sum(counts)
 
         finally:
             # Restore original setting
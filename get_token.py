@@ -1,6 +1,8 @@
 import json
+from functools import lru_cache
 
-def get_aem_token():
+@lru_cache(maxsize=1)
+def _read_aem_token():
     try:
         with open('local_development_token.json', 'r') as f:
             data = json.load(f)
@@ -9,6 +11,16 @@ def get_aem_token():
         print(f"Error reading token: {e}")
         return None
 
+def get_aem_token(force=False):
+    """Return the AEM access token, parsing the token file only once.
+
+    Pass force=True after an authorization failure to re-read the file
+    and pick up a refreshed token.
+    """
+    if force:
+        _read_aem_token.cache_clear()
+    return _read_aem_token()
+
 if __name__ == "__main__":
     token = get_aem_token()
     if token:
@@ -1,6 +1,11 @@
 import os
+import asyncio
+import copy
+import io
+import re
 import random
 import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
 import randomname
@@ -9,14 +14,53 @@ import piexif
 from typing import List, Tuple, Optional
 import queue
 import logging
+from functools import lru_cache
 import argparse
 from dotenv import load_dotenv
 from aem_uploader import AEMUploader
+from aem_uploader_async import AsyncAEMUploader
 from customer_structure import CustomerStructureReplicator
 
 # Load environment variables
 load_dotenv()
 
+# Precompiled once; the per-character Python loops they replace add up
+# over thousands of filenames
+_HAS_DIGIT = re.compile(r'\d').search
+_NON_FILENAME_CHARS = re.compile(r'[^a-z0-9_]')
+
+# Warm randomname's lazy wordlist load at import time so worker threads
+# don't all trigger it at once on their first call
+try:
+    randomname.get_name()
+except Exception:
+    pass
+
+@lru_cache(maxsize=4096)
+def _titleize(name: str) -> str:
+    """Turn hyphenated randomname output into space-separated Title Case words."""
+    return name.replace('-', ' ').title()
+
+# Per-process renderer for the ProcessPoolExecutor workers. Rendering runs in
+# subprocesses so Pillow/piexif work uses all cores instead of contending on
+# the GIL; each worker builds its own ImageProcessor since the parent's
+# (with its locks, queues and HTTP session) can't be pickled.
+_render_processor = None
+
+def _init_render_worker() -> None:
+    global _render_processor
+    _render_processor = ImageProcessor(num_threads=1)
+    # Warm this process's caches (randomname wordlists; the font is loaded
+    # by __init__ above) before the first task lands, so cold-start cost
+    # isn't paid inside the first few renders
+    try:
+        randomname.get_name()
+    except Exception:
+        pass
+
+def _render_image_task(image_path: Path):
+    return _render_processor.generate_image(image_path)
+
 # Set up logging
 logging.basicConfig(
     level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO')),
@@ -30,9 +74,13 @@ logging.basicConfig(
 class ImageProcessor:
     def __init__(self, num_threads: int = None):
         self.num_threads = num_threads or int(os.getenv('NUM_THREADS', '4'))
-        self.task_queue = queue.Queue()
-        self.threads = []
+        self.upload_queue = queue.Queue()
+        # One application-wide thread pool, shared with the customer
+        # structure replicator, so the HTTP connection pool is sized
+        # against a single known worker count
+        self.executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix='aem')
         self.img_dir = Path(os.getenv('INPUT_DIR', 'img'))
+        self._source_images_cache = None
         self.out_dir = Path(os.getenv('OUTPUT_DIR', 'out'))
         self.out_dir.mkdir(exist_ok=True)
         self.processed_count = 0
@@ -47,11 +95,31 @@ class ImageProcessor:
         self.text_color = (255, 255, 255)
         self.text_position = (10, 10)
         self.num_generations = int(os.getenv('NUM_GENERATIONS', '1000'))
-        
+
+        # Load the font once - it is immutable, and truetype() costs a file
+        # open and parse on every call otherwise
+        try:
+            self.font = ImageFont.truetype(self.font_name, self.font_size)
+        except Exception:
+            self.font = ImageFont.load_default()
+
+        # Reusable empty EXIF structure, deep-copied per image
+        self._exif_skeleton = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
+
+
         # Initialize AEM uploader and customer structure replicator
         self.aem_uploader = AEMUploader()
         self.customer_replicator = CustomerStructureReplicator(self.aem_uploader)
 
+    def _list_source_images(self) -> List[Path]:
+        """List jpg/jpeg files in the input directory with one scandir pass, cached."""
+        if self._source_images_cache is None:
+            self._source_images_cache = [
+                Path(entry.path) for entry in os.scandir(self.img_dir)
+                if entry.is_file() and entry.name.lower().endswith(('.jpg', '.jpeg'))
+            ]
+        return self._source_images_cache
+
     def get_random_date(self) -> datetime:
         """Generate a random date between start_date and today."""
         end_date = datetime.now()
@@ -69,11 +137,11 @@ class ImageProcessor:
             filename = image_path.stem.lower()  # Get filename without extension
             
             # Split filename into words and filter according to requirements
-            words = filename.split(' ')
+            words = filename.split()
             for word in words:
                 # Skip if word is too short, contains numbers, or is 'firefly'
-                if (len(word) < 3 or 
-                    any(c.isdigit() for c in word) or 
+                if (len(word) < 3 or
+                    _HAS_DIGIT(word) or
                     word == 'firefly'):
                     continue
                 tags.append(word)
@@ -81,17 +149,15 @@ class ImageProcessor:
             logging.warning(f"Error processing filename for tags: {str(e)}")
             pass  # Continue with just random tags if there's an error
 
-        # Add random tags to reach the minimum required
+        # Add random tags to reach the minimum required; each randomname
+        # call yields several words, so one call usually closes the gap
         while len(tags) < self.min_tags:
             try:
-                # Generate a random name for tag
                 tag = randomname.get_name()
                 if tag:
-                    # Remove any hyphens and capitalize first letter
-                    tag = tag.replace('-', ' ').title()
-                    # Split the tag into separate words and add each as a tag
-                    split_tags = tag.split()
-                    tags.extend(split_tags)
+                    # De-hyphenate and capitalize, cached since the
+                    # wordlist combinations repeat across a batch
+                    tags.extend(_titleize(tag).split())
             except Exception as e:
                 logging.warning(f"Error generating random tag: {str(e)}")
                 # Fallback to simple tag if randomname fails
@@ -105,15 +171,12 @@ class ImageProcessor:
 
     def normalize_filename(self, name: str) -> str:
         """Normalize a filename to ASCII characters."""
-        # Remove any non-ASCII characters and replace spaces with underscores
-        normalized = ''.join(c for c in name if ord(c) < 128)
-        normalized = normalized.replace(' ', '_')
-        # Remove any non-alphanumeric characters except underscores
-        normalized = ''.join(c for c in normalized if c.isalnum() or c == '_')
-        return normalized.lower()
+        # Lowercase, turn spaces into underscores and drop everything that
+        # isn't an ASCII letter, digit or underscore
+        return _NON_FILENAME_CHARS.sub('', name.lower().replace(' ', '_'))
 
-    def process_image(self, image_path: Path, target_folder: Optional[str] = None) -> None:
-        """Process a single image with all required modifications."""
+    def generate_image(self, image_path: Path) -> Optional[Tuple[Path, datetime, List[str], int]]:
+        """Create one randomized output image and return its path, date, tags and size."""
         try:
             # Generate random name and date
             random_name = self.normalize_filename(randomname.get_name())
@@ -122,28 +185,21 @@ class ImageProcessor:
 
             # Open and process image
             with Image.open(str(image_path)) as img:
-                # Create a copy of the image for drawing
-                img_copy = img.copy()
+                # convert() yields the working copy and guarantees a
+                # JPEG-compatible mode in one step
+                img_copy = img.convert('RGB')
                 draw = ImageDraw.Draw(img_copy)
 
-                # Try to load a font, fallback to default if not available
-                try:
-                    font = ImageFont.truetype(self.font_name, self.font_size)
-                except:
-                    font = ImageFont.load_default()
+                # Use the font loaded once in __init__
+                font = self.font
 
                 # Draw text on image
                 text = f"{random_name}\n{random_date.strftime('%Y-%m-%d')}\n{', '.join(tags)}"
                 draw.text(self.text_position, text, font=font, fill=self.text_color)
 
-                # Save the modified image
-                output_path = self.out_dir / f"{random_name}.jpg"
-                img_copy.save(str(output_path), "JPEG")
-
-                # Update EXIF data
-                exif_dict = piexif.load(str(output_path))
-                if exif_dict is None:
-                    exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
+                # Build the EXIF data from scratch - the re-encoded copy
+                # carries none of its own
+                exif_dict = copy.deepcopy(self._exif_skeleton)
 
                 # Update date in EXIF
                 date_str = random_date.strftime("%Y:%m:%d %H:%M:%S")
@@ -161,70 +217,150 @@ class ImageProcessor:
                 exif_dict["0th"][piexif.ImageIFD.XPTitle] = title.encode('utf-16le')
                 exif_dict["0th"][piexif.ImageIFD.ImageDescription] = tags_str.encode('ascii')
 
-                # Save EXIF data
-                exif_bytes = piexif.dump(exif_dict)
-                piexif.insert(exif_bytes, str(output_path))
-
-                # Upload to AEM if enabled
-                if self.aem_uploader.aem_enabled:
-                    if target_folder:
-                        # Override the destination path for customer structure replication
-                        self.aem_uploader.aem_destination = target_folder
-                    self.aem_uploader.upload(output_path, random_date, tags)
+                # Encode once with the EXIF embedded instead of saving,
+                # reloading and rewriting the JPEG on disk
+                output_path = self.out_dir / f"{random_name}.jpg"
+                # quality 85 with 4:2:0 subsampling and no optimize pass keeps
+                # the encode cheap for generated test assets
+                buf = io.BytesIO()
+                img_copy.save(buf, "JPEG", exif=piexif.dump(exif_dict),
+                              quality=85, optimize=False, subsampling=2, progressive=False)
+                output_path.write_bytes(buf.getvalue())
 
-                # Update processed count and log
-                with self.processed_lock:
-                    self.processed_count += 1
-                    logging.info(f"Processed {self.processed_count}: {output_path.name}")
-                    logging.debug(f"  Date: {random_date.strftime('%Y-%m-%d')}")
-                    logging.debug(f"  Tags: {', '.join(tags)}")
+            # The size is already known here, so uploads don't need to stat
+            return output_path, random_date, tags, buf.getbuffer().nbytes
 
         except Exception as e:
             logging.error(f"Error processing {image_path}: {str(e)}")
+            return None
 
-    def worker(self) -> None:
-        """Worker function for thread processing."""
+    def process_image(self, image_path: Path, target_folder: Optional[str] = None) -> None:
+        """Process a single image with all required modifications."""
+        result = self.generate_image(image_path)
+        if result is None:
+            return
+        output_path, random_date, tags, file_size = result
+
+        # Upload to AEM if enabled
+        if self.aem_uploader.aem_enabled:
+            if target_folder:
+                # Override the destination path for customer structure replication
+                self.aem_uploader.aem_destination = target_folder
+            self.aem_uploader.upload(output_path, random_date, tags, file_size=file_size)
+
+        # Update processed count and log
+        with self.processed_lock:
+            self.processed_count += 1
+            logging.info(f"Processed {self.processed_count}: {output_path.name}")
+            logging.debug(f"  Date: {random_date.strftime('%Y-%m-%d')}")
+            logging.debug(f"  Tags: {', '.join(tags)}")
+
+    def upload_worker(self) -> None:
+        """Worker function uploading rendered images until a None sentinel arrives."""
         while True:
-            try:
-                image_path = self.task_queue.get_nowait()
-                self.process_image(image_path)
-            except queue.Empty:
+            item = self.upload_queue.get()
+            if item is None:
                 break
+            output_path, random_date, tags, file_size = item
+
+            if self.aem_uploader.aem_enabled:
+                self.aem_uploader.upload(output_path, random_date, tags, file_size=file_size)
+
+            with self.processed_lock:
+                self.processed_count += 1
+                logging.info(f"Processed {self.processed_count}: {output_path.name}")
+                logging.debug(f"  Date: {random_date.strftime('%Y-%m-%d')}")
+                logging.debug(f"  Tags: {', '.join(tags)}")
 
     def process_directory(self) -> None:
-        """Process specified number of images using multiple threads."""
-        # Get all jpg and jpeg files
-        source_images = list(self.img_dir.glob("*.jpg")) + list(self.img_dir.glob("*.jpeg"))
-        
+        """Process specified number of images: render on all cores, upload in threads."""
+        source_images = self._list_source_images()
+
         if not source_images:
             logging.error("No images found in the input directory!")
             return
 
         logging.info(f"Found {len(source_images)} source images")
         logging.info(f"Will generate {self.num_generations} new images")
-        
+
         # Randomly select images to process
         selected_images = random.choices(source_images, k=self.num_generations)
-        
-        # Add selected images to the queue
-        for image_path in selected_images:
-            self.task_queue.put(image_path)
 
-        # Create and start threads
-        for _ in range(min(self.num_threads, self.num_generations)):
-            thread = threading.Thread(target=self.worker)
-            thread.start()
-            self.threads.append(thread)
+        # Upload workers on the shared executor consume rendered images as
+        # they become available
+        worker_count = min(self.num_threads, self.num_generations)
+        upload_futures = [self.executor.submit(self.upload_worker) for _ in range(worker_count)]
+
+        # Render in subprocesses so the Pillow/piexif work runs on all cores
+        # instead of being serialized by the GIL; each image is written to
+        # disk in the worker and only its path and metadata cross processes
+        try:
+            with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                     initializer=_init_render_worker) as pool:
+                futures = [pool.submit(_render_image_task, p) for p in selected_images]
+                for future in as_completed(futures):
+                    result = future.result()
+                    if result is not None:
+                        self.upload_queue.put(result)
+        finally:
+            # Signal the upload workers to drain and stop
+            for _ in upload_futures:
+                self.upload_queue.put(None)
+            for future in upload_futures:
+                future.result()
+
+        logging.info(f"Processing complete! Generated {self.processed_count} images")
+
+    async def process_directory_async(self, max_concurrent: int = 64) -> None:
+        """Process specified number of images on one event loop with async uploads."""
+        source_images = self._list_source_images()
 
-        # Wait for all threads to complete
-        for thread in self.threads:
-            thread.join()
+        if not source_images:
+            logging.error("No images found in the input directory!")
+            return
+
+        logging.info(f"Found {len(source_images)} source images")
+        logging.info(f"Will generate {self.num_generations} new images")
+
+        # Randomly select images to process
+        selected_images = random.choices(source_images, k=self.num_generations)
+
+        uploader = AsyncAEMUploader()
+        semaphore = asyncio.Semaphore(max_concurrent)
+        loop = asyncio.get_running_loop()
+
+        # Pillow/piexif work is CPU-bound, so it stays in a thread pool while
+        # the event loop keeps up to max_concurrent uploads in flight
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+
+            async def _process(image_path: Path) -> None:
+                async with semaphore:
+                    result = await loop.run_in_executor(executor, self.generate_image, image_path)
+                    if result is None:
+                        return
+                    output_path, random_date, tags, file_size = result
+
+                    if uploader.aem_enabled:
+                        await uploader.upload(output_path, random_date, tags, file_size=file_size)
+
+                    with self.processed_lock:
+                        self.processed_count += 1
+                        logging.info(f"Processed {self.processed_count}: {output_path.name}")
+
+            try:
+                await asyncio.gather(*[_process(p) for p in selected_images])
+            finally:
+                await uploader.close()
 
         logging.info(f"Processing complete! Generated {self.processed_count} images")
 
 def main():
     parser = argparse.ArgumentParser(description='Process images with random metadata and overlays')
     parser.add_argument('--threads', type=int, help='Number of threads to use (overrides NUM_THREADS from .env)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Use the asyncio/aiohttp upload pipeline instead of blocking threads')
+    parser.add_argument('--max-concurrent', type=int, default=64,
+                        help='Maximum concurrent in-flight uploads in async mode (default: 64)')
     args = parser.parse_args()
 
     logging.info(f"Starting image processing with {args.threads or os.getenv('NUM_THREADS', '4')} threads")
@@ -238,7 +374,10 @@ def main():
         # Only process regular batch if customer structure replication is disabled
         if processor.num_generations > 0:
             logging.info("Processing regular batch of random assets")
-            processor.process_directory()
+            if args.use_async:
+                asyncio.run(processor.process_directory_async(args.max_concurrent))
+            else:
+                processor.process_directory()
         else:
             logging.warning("No generations specified and customer structure replication is disabled - nothing to do")
 